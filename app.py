@@ -4,306 +4,351 @@ Truth Engine - Web Frontend
 A simple FastAPI app to search fact-checks and display results.
 """
 
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncpg
+import numpy as np
 from fastapi import FastAPI, Request
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
-import psycopg2
-from sentence_transformers import SentenceTransformer
-
-DB_CONFIG = {
-    "host": "localhost",
-    "port": 5432,
-    "dbname": "truth_db",
-    "user": "truth_user",
-    "password": "truth_password",
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from pgvector.asyncpg import register_vector
+
+from config import DB_CONFIG, HNSW_EF_SEARCH, QUERY_MAX_SEQ_LENGTH, TWEET_URL
+from encoder import OnnxEncoder, ensure_quantized_model
+from semantic_cache import SemanticCache
+
+# asyncpg takes its own keyword names; it has no TCP keepalive options, so
+# max_inactive_connection_lifetime below retires idle connections instead
+DB_CONNECT_KWARGS = {
+    "host": DB_CONFIG["host"],
+    "port": DB_CONFIG["port"],
+    "database": DB_CONFIG["dbname"],
+    "user": DB_CONFIG["user"],
+    "password": DB_CONFIG["password"],
+    "ssl": DB_CONFIG["sslmode"],
+    "timeout": DB_CONFIG["connect_timeout"],
+    "server_settings": {"application_name": DB_CONFIG["application_name"]},
 }
+# Sent as a startup parameter: asyncpg runs RESET ALL when a connection goes
+# back to the pool, which restores startup values but would clear a SET.
+# Unset, the database default from migrate.py --with-indexes applies.
+if HNSW_EF_SEARCH is not None:
+    DB_CONNECT_KWARGS["server_settings"]["hnsw.ef_search"] = str(HNSW_EF_SEARCH)
+# Connection budget for the whole server, split across workers below. Stays
+# well under Postgres' default max_connections=100 (bundled docker image),
+# leaving room for the ingest/enrich scripts and psql.
+POOL_MIN_SIZE = 5
+POOL_MAX_SIZE = 20
+# asyncpg prepares every query and caches the plan per connection
+STATEMENT_CACHE_SIZE = 100
 
-EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 SIMILARITY_THRESHOLD = 0.4
+TOP_K = 5
+# Reuse results for near-duplicate queries (cosine similarity >= threshold)
+CACHE_SIMILARITY = 0.95
+CACHE_TTL_SECONDS = 300
+CACHE_MAX_ENTRIES = 10_000
+# Keyword matching (/api/keyword-matches): notes within this cosine distance
+KEYWORD_MATCH_DISTANCE = 0.5
+KEYWORD_MATCH_LIMIT = 50
+# Keyword phrases repeat heavily; a phrase within KEYWORD_CACHE_TAU cosine
+# distance of a recent one reuses its matches
+KEYWORD_CACHE_TAU = float(os.getenv("KEYWORD_CACHE_TAU", "0.05"))
+KEYWORD_CACHE_SIZE = int(os.getenv("KEYWORD_CACHE_SIZE", "1024"))
+# Counts change only when ingestion/enrichment runs; don't rescan per page load
+STATS_TTL_SECONDS = 30
+# Micro-batching: encode up to N queued queries together, waiting at most this long
+ENCODE_BATCH_SIZE = 16
+ENCODE_BATCH_WAIT = 0.02
+# One worker per core by default (Uvicorn's WEB_CONCURRENCY overrides).
+WORKERS = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+# Each worker holds its own pool, so size it so WORKERS * pool stays within
+# the budget. Two connections minimum: a search queries both vector columns
+# concurrently.
+WORKER_POOL_MAX_SIZE = max(2, POOL_MAX_SIZE // WORKERS)
+WORKER_POOL_MIN_SIZE = min(POOL_MIN_SIZE, WORKER_POOL_MAX_SIZE)
+
+# Kept as a constant so the text is identical on every call and hits the
+# per-connection prepared statement cache.
+# Vectors are unit-norm, so order by negative inner product (<#>, one dot
+# product per row) and report cosine distance as 1 + (a <#> b).
+TWEET_SEARCH_SQL = f"""
+    SELECT
+        tweet_id,
+        tweet_text,
+        note_text,
+        1 + (tweet_vector <#> $1::halfvec) AS distance
+    FROM fact_checks
+    WHERE tweet_vector IS NOT NULL
+    ORDER BY tweet_vector <#> $1::halfvec
+    LIMIT {TOP_K}
+"""
+NOTE_SEARCH_SQL = f"""
+    SELECT
+        tweet_id,
+        tweet_text,
+        note_text,
+        1 + (note_vector <#> $1::halfvec) AS distance
+    FROM fact_checks
+    WHERE note_vector IS NOT NULL
+    ORDER BY note_vector <#> $1::halfvec
+    LIMIT {TOP_K}
+"""
+# "a <#> b < d - 1" is the same filter as cosine distance < d
+KEYWORD_MATCH_SQL = f"""
+    SELECT
+        tweet_id,
+        note_text,
+        1 + (note_vector <#> $1::halfvec) AS distance
+    FROM fact_checks
+    WHERE note_vector <#> $1::halfvec < {KEYWORD_MATCH_DISTANCE - 1}
+    ORDER BY note_vector <#> $1::halfvec
+    LIMIT {KEYWORD_MATCH_LIMIT}
+"""
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
 
 app = FastAPI(title="Truth Engine")
+app.add_middleware(GZipMiddleware, minimum_size=500)
+
+templates = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=select_autoescape(),
+    enable_async=True,
+)
 
-# Load model at startup
+# Load model and connection pool at startup
 model = None
-conn = None
+pool = None
+cache = None
+keyword_cache = None
+home_template = None
+home_html = None
+# (stats dict, monotonic time it was computed)
+stats_cache = (None, 0.0)
+# Encoding is CPU-bound, so keep it off the event loop
+encoder_pool = ThreadPoolExecutor(max_workers=1)
+# (query, future) pairs waiting to be encoded by batcher()
+pending = None
+batcher_task = None
+
+
+async def init_connection(conn):
+    """Register the pgvector codec on every new pooled connection."""
+    await register_vector(conn)
+
+
+async def batcher():
+    """Pull queued queries and encode them in batches, resolving each request's future."""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await pending.get()]
+        deadline = loop.time() + ENCODE_BATCH_WAIT
+        while len(batch) < ENCODE_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(pending.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        texts = [text for text, _ in batch]
+        try:
+            embeddings = await loop.run_in_executor(encoder_pool, model.encode, texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+
+async def submit(text: str):
+    """Queue a query for the batcher and wait for its embedding."""
+    future = asyncio.get_running_loop().create_future()
+    await pending.put((text, future))
+    return await future
 
 
 @app.on_event("startup")
-def startup():
-    global model, conn
-    print("Loading embedding model...")
-    model = SentenceTransformer(EMBEDDING_MODEL)
+async def startup():
+    global model, pool, cache, keyword_cache, pending, batcher_task, home_template, home_html
+    home_template = templates.get_template("home.html")
+    # The landing page has no per-request content, so render it once
+    home_html = await home_template.render_async(query="", results=None)
+    print("Loading embedding model (ONNX INT8)...")
+    model = OnnxEncoder(intra_op_num_threads=max(2, (os.cpu_count() or 1) // WORKERS))
+    model.max_seq_length = QUERY_MAX_SEQ_LENGTH
+    # Trigger Numba's JIT compile of mean pooling now, not on the first request
+    model.encode("warmup")
     print("Connecting to database...")
-    conn = psycopg2.connect(**DB_CONFIG)
+    pool = await asyncpg.create_pool(
+        **DB_CONNECT_KWARGS,
+        min_size=WORKER_POOL_MIN_SIZE,
+        max_size=WORKER_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=600,
+        statement_cache_size=STATEMENT_CACHE_SIZE,
+        init=init_connection,
+    )
+    cache = SemanticCache(
+        threshold=CACHE_SIMILARITY,
+        ttl=CACHE_TTL_SECONDS,
+        max_entries=CACHE_MAX_ENTRIES,
+    )
+    keyword_cache = SemanticCache(
+        threshold=1 - KEYWORD_CACHE_TAU,
+        ttl=CACHE_TTL_SECONDS,
+        max_entries=KEYWORD_CACHE_SIZE,
+    )
+    pending = asyncio.Queue()
+    batcher_task = asyncio.create_task(batcher())
 
 
 @app.on_event("shutdown")
-def shutdown():
-    global conn
-    if conn:
-        conn.close()
+async def shutdown():
+    if batcher_task:
+        batcher_task.cancel()
+    if pool:
+        await pool.close()
+    encoder_pool.shutdown(wait=False)
 
 
 @app.get("/", response_class=HTMLResponse)
-def home():
-    return """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Truth Engine</title>
-    <style>
-        * { box-sizing: border-box; margin: 0; padding: 0; }
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-            background: #0f0f0f;
-            color: #e0e0e0;
-            min-height: 100vh;
-            padding: 2rem;
-        }
-        .container { max-width: 800px; margin: 0 auto; }
-        h1 {
-            font-size: 2.5rem;
-            margin-bottom: 0.5rem;
-            background: linear-gradient(90deg, #ff6b6b, #feca57);
-            -webkit-background-clip: text;
-            -webkit-text-fill-color: transparent;
-        }
-        .subtitle { color: #888; margin-bottom: 2rem; }
-        .search-box {
-            display: flex;
-            gap: 1rem;
-            margin-bottom: 2rem;
-        }
-        input[type="text"] {
-            flex: 1;
-            padding: 1rem;
-            font-size: 1rem;
-            border: 2px solid #333;
-            border-radius: 8px;
-            background: #1a1a1a;
-            color: #fff;
-            outline: none;
-            transition: border-color 0.2s;
-        }
-        input[type="text"]:focus { border-color: #ff6b6b; }
-        button {
-            padding: 1rem 2rem;
-            font-size: 1rem;
-            font-weight: 600;
-            border: none;
-            border-radius: 8px;
-            background: linear-gradient(90deg, #ff6b6b, #ee5a5a);
-            color: #fff;
-            cursor: pointer;
-            transition: transform 0.1s;
-        }
-        button:hover { transform: scale(1.02); }
-        button:disabled { opacity: 0.5; cursor: not-allowed; }
-        .results { display: flex; flex-direction: column; gap: 1rem; }
-        .result-card {
-            background: #1a1a1a;
-            border-radius: 12px;
-            padding: 1.5rem;
-            border-left: 4px solid #333;
-        }
-        .result-card.match { border-left-color: #ff6b6b; }
-        .result-card.safe { border-left-color: #26de81; }
-        .result-header {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 1rem;
-        }
-        .badge {
-            padding: 0.25rem 0.75rem;
-            border-radius: 20px;
-            font-size: 0.8rem;
-            font-weight: 600;
-        }
-        .badge.match { background: #ff6b6b22; color: #ff6b6b; }
-        .badge.safe { background: #26de8122; color: #26de81; }
-        .score { color: #888; font-size: 0.9rem; }
-        .section { margin-bottom: 1rem; }
-        .section-label {
-            font-size: 0.75rem;
-            text-transform: uppercase;
-            color: #666;
-            margin-bottom: 0.5rem;
-        }
-        .tweet-text { color: #ff8888; }
-        .note-text { color: #88ff88; }
-        .tweet-url {
-            font-size: 0.8rem;
-            color: #4a9eff;
-            text-decoration: none;
-        }
-        .tweet-url:hover { text-decoration: underline; }
-        .loading { text-align: center; color: #888; padding: 2rem; }
-        .empty { text-align: center; color: #666; padding: 3rem; }
-        .stats {
-            background: #1a1a1a;
-            padding: 1rem;
-            border-radius: 8px;
-            margin-bottom: 2rem;
-            display: flex;
-            gap: 2rem;
-        }
-        .stat { text-align: center; }
-        .stat-value { font-size: 1.5rem; font-weight: bold; color: #feca57; }
-        .stat-label { font-size: 0.8rem; color: #666; }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>Truth Engine</h1>
-        <p class="subtitle">Semantic fact-checker powered by X Community Notes</p>
-
-        <div id="stats" class="stats">
-            <div class="stat">
-                <div class="stat-value" id="total-count">-</div>
-                <div class="stat-label">Total Fact Checks</div>
-            </div>
-            <div class="stat">
-                <div class="stat-value" id="enriched-count">-</div>
-                <div class="stat-label">With Tweet Text</div>
-            </div>
-        </div>
-
-        <div class="search-box">
-            <input type="text" id="query" placeholder="Enter a claim or headline to fact-check..." />
-            <button id="search-btn" onclick="search()">Search</button>
-        </div>
-
-        <div id="results" class="results"></div>
-    </div>
-
-    <script>
-        // Load stats on page load
-        fetch('/api/stats')
-            .then(r => r.json())
-            .then(data => {
-                document.getElementById('total-count').textContent = data.total.toLocaleString();
-                document.getElementById('enriched-count').textContent = data.enriched.toLocaleString();
-            });
-
-        // Search on Enter key
-        document.getElementById('query').addEventListener('keypress', e => {
-            if (e.key === 'Enter') search();
-        });
-
-        async function search() {
-            const query = document.getElementById('query').value.trim();
-            if (!query) return;
-
-            const btn = document.getElementById('search-btn');
-            const results = document.getElementById('results');
-
-            btn.disabled = true;
-            btn.textContent = 'Searching...';
-            results.innerHTML = '<div class="loading">Searching...</div>';
-
-            try {
-                const res = await fetch('/api/search?q=' + encodeURIComponent(query));
-                const data = await res.json();
-
-                if (data.results.length === 0) {
-                    results.innerHTML = '<div class="empty">No matching fact-checks found.</div>';
-                } else {
-                    results.innerHTML = data.results.map(r => `
-                        <div class="result-card ${r.is_match ? 'match' : 'safe'}">
-                            <div class="result-header">
-                                <span class="badge ${r.is_match ? 'match' : 'safe'}">
-                                    ${r.is_match ? '⚠️ MATCH FOUND' : '✅ Low Similarity'}
-                                </span>
-                                <span class="score">${(r.similarity * 100).toFixed(1)}% similar (distance: ${r.distance.toFixed(4)})</span>
-                            </div>
-                            ${r.tweet_text ? `
-                                <div class="section">
-                                    <div class="section-label">Original Tweet (The Claim)</div>
-                                    <div class="tweet-text">${escapeHtml(r.tweet_text)}</div>
-                                </div>
-                            ` : ''}
-                            <div class="section">
-                                <div class="section-label">Community Note (The Fact-Check)</div>
-                                <div class="note-text">${escapeHtml(r.note_text)}</div>
-                            </div>
-                            <a class="tweet-url" href="${r.tweet_url}" target="_blank">View original tweet →</a>
-                        </div>
-                    `).join('');
-                }
-            } catch (err) {
-                results.innerHTML = '<div class="empty">Error searching. Please try again.</div>';
-            }
-
-            btn.disabled = false;
-            btn.textContent = 'Search';
-        }
+async def home():
+    return HTMLResponse(home_html, headers={"Cache-Control": "public, max-age=3600"})
+
 
-        function escapeHtml(text) {
-            const div = document.createElement('div');
-            div.textContent = text;
-            return div.innerHTML;
+@app.get("/api/stats")
+async def get_stats():
+    global stats_cache
+    stats, computed_at = stats_cache
+    if stats is not None and time.monotonic() - computed_at < STATS_TTL_SECONDS:
+        return stats
+
+    # Both counts from a single scan
+    async with pool.acquire() as conn:
+        total, enriched = await conn.fetchrow(
+            """
+            SELECT
+                COUNT(*),
+                COUNT(*) FILTER (WHERE tweet_text IS NOT NULL AND tweet_text != 'MISSING_OR_DELETED')
+            FROM fact_checks
+            """
+        )
+    stats = {"total": total, "enriched": enriched}
+    stats_cache = (stats, time.monotonic())
+    return stats
+
+
+async def fetch_rows(sql: str, embedding) -> list[asyncpg.Record]:
+    async with pool.acquire() as conn:
+        return await conn.fetch(sql, embedding)
+
+
+async def run_search(q: str) -> list[dict]:
+    # Generate embedding for query (batched with concurrent requests)
+    query_embedding = await submit(q)
+
+    cached = cache.get(query_embedding)
+    if cached is not None:
+        return cached
+
+    # Search tweet_vector (The Lie) and note_vector (The Truth) concurrently
+    # on two pooled connections, so latency is max(t, n) rather than t + n
+    tweet_rows, note_rows = await asyncio.gather(
+        fetch_rows(TWEET_SEARCH_SQL, query_embedding),
+        fetch_rows(NOTE_SEARCH_SQL, query_embedding),
+    )
+
+    # Merge by tweet, keeping whichever side matched more closely
+    best = {}
+    for row in (*tweet_rows, *note_rows):
+        current = best.get(row["tweet_id"])
+        if current is None or row["distance"] < current["distance"]:
+            best[row["tweet_id"]] = row
+    rows = sorted(best.values(), key=lambda row: row["distance"])[:TOP_K]
+
+    # Score all rows at once
+    distances = np.fromiter((row["distance"] for row in rows), dtype=np.float64, count=len(rows))
+    similarities = 1.0 - distances
+    is_match = distances < SIMILARITY_THRESHOLD
+
+    results = [
+        {
+            "tweet_id": tweet_id,
+            "tweet_url": TWEET_URL.format(tweet_id=tweet_id),
+            "tweet_text": tweet_text if tweet_text and tweet_text != "MISSING_OR_DELETED" else None,
+            "note_text": note_text,
+            "distance": distance,
+            "similarity": similarity,
+            "is_match": match,
         }
-    </script>
-</body>
-</html>
-"""
+        for (tweet_id, tweet_text, note_text, _), distance, similarity, match
+        in zip(rows, distances.tolist(), similarities.tolist(), is_match.tolist())
+    ]
 
+    cache.put(query_embedding, results)
+    return results
 
-@app.get("/api/stats")
-def get_stats():
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM fact_checks")
-    total = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM fact_checks WHERE tweet_text IS NOT NULL AND tweet_text != 'MISSING_OR_DELETED'")
-    enriched = cursor.fetchone()[0]
-    cursor.close()
-    return {"total": total, "enriched": enriched}
 
+async def run_keyword_match(keyword: str) -> list[dict]:
+    embedding = await submit(keyword)
 
-@app.get("/api/search")
-def search(q: str):
-    # Generate embedding for query
-    query_embedding = model.encode(q).tolist()
-
-    cursor = conn.cursor()
-
-    # Search against tweet_vector (The Lie) - finds claims similar to query
-    cursor.execute(
-        """
-        SELECT
-            tweet_id,
-            tweet_url,
-            tweet_text,
-            note_text,
-            tweet_vector <=> %s::vector AS distance
-        FROM fact_checks
-        WHERE tweet_vector IS NOT NULL
-        ORDER BY distance
-        LIMIT 5
-        """,
-        (query_embedding,)
-    )
+    cached = keyword_cache.get(embedding)
+    if cached is not None:
+        return cached
 
-    results = []
-    for row in cursor.fetchall():
-        tweet_id, tweet_url, tweet_text, note_text, distance = row
-        results.append({
+    rows = await fetch_rows(KEYWORD_MATCH_SQL, embedding)
+    results = [
+        {
             "tweet_id": tweet_id,
-            "tweet_url": tweet_url,
-            "tweet_text": tweet_text if tweet_text and tweet_text != "MISSING_OR_DELETED" else None,
+            "tweet_url": TWEET_URL.format(tweet_id=tweet_id),
             "note_text": note_text,
-            "distance": float(distance),
-            "similarity": 1 - float(distance),
-            "is_match": float(distance) < SIMILARITY_THRESHOLD
-        })
+            "distance": distance,
+        }
+        for tweet_id, note_text, distance in rows
+    ]
+
+    keyword_cache.put(embedding, results)
+    return results
+
+
+@app.get("/api/keyword-matches")
+async def keyword_matches(keyword: str):
+    return {"keyword": keyword, "results": await run_keyword_match(keyword)}
+
 
-    cursor.close()
-    return {"query": q, "results": results}
+@app.get("/api/search")
+async def search(q: str):
+    return {"query": q, "results": await run_search(q)}
+
+
+@app.get("/search", response_class=HTMLResponse)
+async def search_page(q: str = ""):
+    q = q.strip()
+    results = await run_search(q) if q else None
+    return await home_template.render_async(query=q, results=results)
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+
+    # Export the model once here, not racing in every worker's startup
+    ensure_quantized_model()
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=WORKERS,
+        loop="uvloop",
+        http="httptools",
+    )
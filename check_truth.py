@@ -5,19 +5,14 @@ Since we don't have the original tweets ("Lies"),
 we search the Notes ("Truths") directly.
 """
 
+import numpy as np
 import psycopg2
-from sentence_transformers import SentenceTransformer
-
-# Database Config
-DB_CONFIG = {
-    "host": "localhost",
-    "port": 5432,
-    "dbname": "truth_db",
-    "user": "truth_user",
-    "password": "truth_password",
-}
-
-EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+from pgvector import HalfVector
+from pgvector.psycopg2 import register_vector
+
+from config import DB_CONFIG, HNSW_EF_SEARCH, QUERY_MAX_SEQ_LENGTH, TWEET_URL
+from encoder import OnnxEncoder
+
 # Notes are longer and more detailed, so we can be slightly looser with the threshold
 SIMILARITY_THRESHOLD = 0.5  
 TOP_K = 3
@@ -28,19 +23,29 @@ BOLD = "\033[1m"
 RESET = "\033[0m"
 CYAN = "\033[96m"
 
-def search_notes(cursor, embedding: list[float], top_k: int = TOP_K) -> list[tuple]:
+def prepare_search(cursor):
     """
-    Search against 'note_vector' (The Truth) directly.
+    Prepare the search query once per connection so each search
+    skips parsing and planning. Vectors are unit-norm, so we rank by
+    negative inner product (<#>) and report cosine distance as 1 + (a <#> b).
     """
     cursor.execute(
         """
-        SELECT note_text, tweet_url, note_vector <=> %s::vector AS distance
+        PREPARE search_notes (halfvec, int) AS
+        SELECT note_text, tweet_id, 1 + (note_vector <#> $1) AS distance
         FROM fact_checks
-        ORDER BY distance ASC
-        LIMIT %s
-        """,
-        (embedding, top_k)
+        WHERE note_vector IS NOT NULL
+        ORDER BY note_vector <#> $1
+        LIMIT $2
+        """
     )
+
+def search_notes(cursor, embedding: np.ndarray, top_k: int = TOP_K) -> list[tuple]:
+    """
+    Search against 'note_vector' (The Truth) directly.
+    Requires register_vector() and prepare_search() on this connection.
+    """
+    cursor.execute("EXECUTE search_notes (%s, %s)", (HalfVector(embedding), top_k))
     return cursor.fetchall()
 
 def display_results(results: list[tuple]):
@@ -48,35 +53,46 @@ def display_results(results: list[tuple]):
         print("No matches found.")
         return
 
-    best_distance = results[0][2]
+    # Score all rows at once
+    distances = np.fromiter((row[2] for row in results), dtype=np.float64, count=len(results))
+    similarities = (1.0 - distances) * 100
+    relevant = distances <= SIMILARITY_THRESHOLD
 
-    if best_distance < SIMILARITY_THRESHOLD:
+    if distances[0] < SIMILARITY_THRESHOLD:
         print(f"\n{GREEN}{BOLD}✅ RELEVANT FACT CHECKS FOUND{RESET}")
         print("-" * 60)
         
-        for i, (note_text, tweet_url, distance) in enumerate(results, 1):
-            if distance > SIMILARITY_THRESHOLD:
+        for i, ((note_text, tweet_id, _), similarity, is_relevant) in enumerate(
+            zip(results, similarities.tolist(), relevant.tolist()), 1
+        ):
+            if not is_relevant:
                 continue
                 
-            similarity = (1 - distance) * 100
             print(f"{BOLD}Result #{i} ({similarity:.1f}% Match):{RESET}")
             print(f"{note_text}")
-            print(f"{CYAN}Source: {tweet_url}{RESET}")
+            print(f"{CYAN}Source: {TWEET_URL.format(tweet_id=tweet_id)}{RESET}")
             print("-" * 60)
     else:
         print(f"\nNo exact matches. Here is the closest topic in the database:")
         print("-" * 60)
-        note_text, tweet_url, distance = results[0]
+        note_text, tweet_id, distance = results[0]
         print(f"{note_text}")
-        print(f"Source: {tweet_url}")
+        print(f"Source: {TWEET_URL.format(tweet_id=tweet_id)}")
 
 def main():
     print(f"Loading AI model...")
-    model = SentenceTransformer(EMBEDDING_MODEL)
+    model = OnnxEncoder()
+    model.max_seq_length = QUERY_MAX_SEQ_LENGTH
 
     print("Connecting to database...")
     conn = psycopg2.connect(**DB_CONFIG)
+    # Read-only session: a failed search shouldn't leave an aborted transaction behind
+    conn.autocommit = True
+    register_vector(conn)
     cursor = conn.cursor()
+    if HNSW_EF_SEARCH is not None:
+        cursor.execute("SET hnsw.ef_search = %s", (HNSW_EF_SEARCH,))
+    prepare_search(cursor)
 
     print("\n" + "=" * 60)
     print(f"{BOLD}COMMUNITY NOTES SEARCH{RESET}")
@@ -95,7 +111,7 @@ def main():
                 continue
 
             # Generate embedding
-            query_vector = model.encode(user_input).tolist()
+            query_vector = model.encode(user_input)
 
             # Search DB
             results = search_notes(cursor, query_vector)
@@ -0,0 +1,38 @@
+"""
+Database connection settings, read from the standard libpq environment
+variables. Defaults match docker-compose.yml, except the password, which
+must come from PGPASSWORD (or ~/.pgpass) so it never lives in source.
+"""
+
+import os
+
+DB_CONFIG = {
+    "host": os.environ.get("PGHOST", "localhost"),
+    "port": int(os.environ.get("PGPORT", "5432")),
+    "dbname": os.environ.get("PGDATABASE", "truth_db"),
+    "user": os.environ.get("PGUSER", "truth_user"),
+    "password": os.environ.get("PGPASSWORD"),
+    # The local docker database has no TLS; use PGSSLMODE=require or
+    # verify-full against a remote server
+    "sslmode": os.environ.get("PGSSLMODE", "prefer"),
+    "application_name": os.environ.get("PGAPPNAME", "truth_engine"),
+    # Fail fast on unreachable hosts and detect connections dropped by NAT
+    # or firewalls instead of hanging on them
+    "connect_timeout": 5,
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+}
+
+# HNSW candidate list size at query time: higher = better recall, slower
+# queries. migrate.py --with-indexes persists a corpus-size tier as the
+# database default; setting HNSW_EF_SEARCH overrides it there and in every
+# search session.
+HNSW_EF_SEARCH = int(os.environ["HNSW_EF_SEARCH"]) if os.environ.get("HNSW_EF_SEARCH") else None
+
+# Search queries are short; attention cost grows quadratically with length
+QUERY_MAX_SEQ_LENGTH = 64
+
+# URLs are derived from tweet_id rather than stored per row
+TWEET_URL = "https://twitter.com/i/web/status/{tweet_id}"
@@ -0,0 +1,58 @@
+"""
+Shared psycopg2 connection pool for the setup scripts.
+
+migrate, init_db and init_keywords borrow connections from one
+pool, so running several steps in the same process pays the connection
+setup cost once and reuses server-side prepared statements.
+"""
+
+import atexit
+from contextlib import contextmanager
+
+from psycopg2.pool import ThreadedConnectionPool
+
+from config import DB_CONFIG
+
+POOL_MIN_CONN = 1
+POOL_MAX_CONN = 8
+
+_pool: ThreadedConnectionPool | None = None
+
+
+def get_pool() -> ThreadedConnectionPool:
+    """Create the pool on first use so importing this module doesn't connect."""
+    global _pool
+    if _pool is None:
+        _pool = ThreadedConnectionPool(POOL_MIN_CONN, POOL_MAX_CONN, **DB_CONFIG)
+    return _pool
+
+
+def close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+
+
+atexit.register(close_pool)
+
+
+@contextmanager
+def conn(autocommit: bool = False):
+    """
+    Borrow a pooled connection. Commits on success and rolls back on
+    error unless autocommit is set (needed for CREATE INDEX CONCURRENTLY).
+    """
+    pool = get_pool()
+    c = pool.getconn()
+    try:
+        c.autocommit = autocommit
+        yield c
+        if not autocommit:
+            c.commit()
+    except Exception:
+        if not c.closed and not c.autocommit:
+            c.rollback()
+        raise
+    finally:
+        pool.putconn(c)
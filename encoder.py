@@ -0,0 +1,143 @@
+"""
+INT8-quantized ONNX encoder for all-MiniLM-L6-v2.
+
+Exports the SentenceTransformer model to ONNX once, quantizes it with
+dynamic AVX512-VNNI INT8 weights, and runs it through onnxruntime.
+Produces the same mean-pooled, L2-normalized 384-dim embeddings as
+SentenceTransformer, as float32 NumPy arrays.
+"""
+
+import math
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import onnxruntime as ort
+from numba import njit
+from transformers import AutoTokenizer
+
+HF_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Exported artifact is cached per user so every script and checkout shares it
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "truth_engine")
+ONNX_DIR = os.path.join(CACHE_DIR, "all-MiniLM-L6-v2-onnx")
+QUANTIZED_FILE = "model_quantized.onnx"
+MAX_SEQ_LENGTH = 256
+
+
+@njit(fastmath=True, cache=True)
+def mean_pool_normalize(hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """
+    Masked mean over tokens followed by L2 normalization, fused into one
+    pass per row. hidden: (batch, seq_len, dim) float32, mask: (batch, seq_len).
+    """
+    batch, seq_len, dim = hidden.shape
+    out = np.zeros((batch, dim), dtype=np.float32)
+    for b in range(batch):
+        count = 0
+        for i in range(seq_len):
+            if mask[b, i]:
+                for j in range(dim):
+                    out[b, j] += hidden[b, i, j]
+                count += 1
+        inv = 1.0 / max(count, 1)
+        norm = 0.0
+        for j in range(dim):
+            out[b, j] *= inv
+            norm += out[b, j] * out[b, j]
+        inv_norm = 1.0 / math.sqrt(max(norm, 1e-24))
+        for j in range(dim):
+            out[b, j] *= inv_norm
+    return out
+
+
+def export_quantized_model(output_dir: str = ONNX_DIR) -> str:
+    """
+    Export the model to ONNX and quantize it to INT8. Returns the .onnx path.
+    Built in a temporary sibling directory and moved into place in one step,
+    so concurrent processes never see a half-written model.
+    """
+    # Export tooling is only needed once, so keep it out of the serving path
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    parent = os.path.dirname(os.path.abspath(output_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".onnx-export-", dir=parent)
+    try:
+        print(f"Exporting {HF_MODEL} to ONNX...")
+        ort_model = ORTModelForFeatureExtraction.from_pretrained(HF_MODEL, export=True)
+        ort_model.save_pretrained(tmp_dir)
+        AutoTokenizer.from_pretrained(HF_MODEL).save_pretrained(tmp_dir)
+
+        print("Quantizing to INT8 (dynamic, AVX512-VNNI)...")
+        quantizer = ORTQuantizer.from_pretrained(ort_model)
+        qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=tmp_dir, quantization_config=qconfig)
+
+        model_path = os.path.join(output_dir, QUANTIZED_FILE)
+        if os.path.exists(model_path):
+            # Another process finished first; keep its copy
+            return model_path
+        # Leftover from an interrupted non-atomic export
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.replace(tmp_dir, output_dir)
+        return model_path
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def ensure_quantized_model(model_dir: str = ONNX_DIR) -> str:
+    """Path to the quantized model, exporting it first if it isn't cached yet."""
+    model_path = os.path.join(model_dir, QUANTIZED_FILE)
+    if os.path.exists(model_path):
+        return model_path
+    return export_quantized_model(model_dir)
+
+
+class OnnxEncoder:
+    """Drop-in replacement for SentenceTransformer.encode backed by onnxruntime."""
+
+    def __init__(self, model_dir: str = ONNX_DIR, intra_op_num_threads: int | None = None):
+        model_path = ensure_quantized_model(model_dir)
+
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sess_options.enable_mem_pattern = True
+        sess_options.enable_cpu_mem_arena = True
+        if intra_op_num_threads:
+            sess_options.intra_op_num_threads = intra_op_num_threads
+
+        self.session = ort.InferenceSession(
+            model_path, sess_options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = MAX_SEQ_LENGTH
+
+    def encode(self, texts: str | list[str]) -> np.ndarray:
+        """Encode one text (returns shape (384,)) or a list (returns (n, 384))."""
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+
+        tokens = self.tokenizer(
+            batch,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np",
+        )
+        feeds = {
+            name: tokens[name].astype(np.int64)
+            for name in ("input_ids", "attention_mask", "token_type_ids")
+            if name in self.input_names
+        }
+        hidden = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens, then L2 normalize
+        embeddings = mean_pool_normalize(
+            np.ascontiguousarray(hidden, dtype=np.float32),
+            tokens["attention_mask"],
+        )
+
+        return embeddings[0] if single else embeddings
@@ -3,22 +3,35 @@ Enrich fact_checks using the Twitter Syndication API.
 This API is more reliable than oEmbed and provides cleaner data.
 """
 
-import time
+import asyncio
+import logging
+from collections import Counter
+
+import aiohttp
 import psycopg2
-import requests
+import torch
+from asyncio_throttle import Throttler
+from pgvector import HalfVector
+from pgvector.psycopg2 import register_vector
+from psycopg2.extras import execute_values
 from sentence_transformers import SentenceTransformer
+from tqdm import tqdm
+from tqdm.contrib.logging import logging_redirect_tqdm
 
-DB_CONFIG = {
-    "host": "localhost",
-    "port": 5432,
-    "dbname": "truth_db",
-    "user": "truth_user",
-    "password": "truth_password",
-}
+from config import DB_CONFIG
+
+logger = logging.getLogger(__name__)
 
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
-BATCH_SIZE = 100
-REQUEST_DELAY = 1.0  # Syndication API is faster, 1s is safe
+BATCH_SIZE = 500
+CONCURRENCY = 20  # Max in-flight requests to the Syndication API
+REQUESTS_PER_SECOND = 20
+REQUEST_TIMEOUT = 10
+ENCODE_BATCH_SIZE = 64
+UPDATE_PAGE_SIZE = 100
+MAX_SEQ_LENGTH = 64  # Tweets are short; truncating bounds attention cost
+LOG_EVERY = 100  # Rows between progress log lines
+MAX_ERRORS_LOGGED = 5  # Per exception type, to keep a flaky API from flooding the log
 
 # Header to look like a browser requesting an embedded tweet
 HEADERS = {
@@ -27,31 +40,27 @@ HEADERS = {
     "Referer": "https://platform.twitter.com/"
 }
 
-def fetch_tweet_details(tweet_url: str) -> tuple[str, str] | None:
+async def fetch_tweet_details(
+    session: aiohttp.ClientSession,
+    semaphore: asyncio.Semaphore,
+    throttler: Throttler,
+    tweet_id: int,
+) -> tuple[str, str] | None:
     """
     Fetch tweet details using the CDN Syndication API.
     Returns: (text, format) or None.
     """
-    # Extract Tweet ID from URL
-    try:
-        # url looks like https://twitter.com/i/web/status/123456789
-        tweet_id = tweet_url.split("/")[-1].split("?")[0]
-        if not tweet_id.isdigit():
-            return None
-    except:
-        return None
-
     # This is the magic endpoint
     api_url = f"https://cdn.syndication.twimg.com/tweet-result?id={tweet_id}&token=x"
 
     try:
-        response = requests.get(api_url, headers=HEADERS, timeout=10)
-        
-        if response.status_code == 404:
-            return "MISSING", "Unknown"
-        
-        response.raise_for_status()
-        data = response.json()
+        async with semaphore, throttler:
+            async with session.get(api_url, headers=HEADERS) as response:
+                if response.status == 404:
+                    return "MISSING", "Unknown"
+
+                response.raise_for_status()
+                data = await response.json(content_type=None)
 
         # 1. Get Text
         text = data.get("text", "")
@@ -69,104 +78,176 @@ def fetch_tweet_details(tweet_url: str) -> tuple[str, str] | None:
         return text, tweet_format
 
     except Exception as e:
-        print(f"  Error fetching {tweet_id}: {e}")
+        log_fetch_error(tweet_id, e)
         return None
 
-def get_null_rows(cursor, limit: int = BATCH_SIZE) -> list[tuple]:
-    """Get rows where tweet_text is NULL."""
+error_counts = Counter()
+
+def log_fetch_error(tweet_id: int, error: Exception):
+    """Log the first few errors of each type, then just count them."""
+    kind = type(error).__name__
+    error_counts[kind] += 1
+    if error_counts[kind] <= MAX_ERRORS_LOGGED:
+        logger.warning("Error fetching %s: %s", tweet_id, error)
+    if error_counts[kind] == MAX_ERRORS_LOGGED:
+        logger.warning("Suppressing further %s errors", kind)
+
+def count_null_rows(cursor) -> int:
+    """Count rows still waiting for tweet text."""
+    cursor.execute(
+        """
+        SELECT COUNT(*)
+        FROM fact_checks
+        WHERE tweet_text IS NULL
+        AND (tweet_format IS NULL OR tweet_format != 'Missing')
+        """
+    )
+    return cursor.fetchone()[0]
+
+def get_null_rows(cursor, failed_ids: list[int], limit: int = BATCH_SIZE) -> list[tuple]:
+    """Get rows where tweet_text is NULL, skipping rows that already failed this run."""
     # We explicitly exclude rows we've already marked as 'Missing' to prevent loops
     cursor.execute(
         """
-        SELECT id, tweet_url
+        SELECT id, tweet_id
         FROM fact_checks
         WHERE tweet_text IS NULL 
         AND (tweet_format IS NULL OR tweet_format != 'Missing')
+        AND id <> ALL(%s::int[])
         LIMIT %s
         """,
-        (limit,)
+        (failed_ids, limit)
     )
     return cursor.fetchall()
 
-def update_row(cursor, row_id: int, tweet_text: str, tweet_vector: list[float] | None, tweet_format: str):
-    """Update database row."""
-    if tweet_vector is None:
-        # Mark missing so we don't try again
+def update_rows(cursor, found: list[tuple], missing_ids: list[int]):
+    """
+    Bulk update database rows.
+    found: (row_id, tweet_text, tweet_vector, tweet_format) tuples.
+    missing_ids: rows whose tweet is gone, marked so we don't try again.
+    """
+    if missing_ids:
         cursor.execute(
             """
             UPDATE fact_checks
             SET tweet_text = %s, tweet_format = 'Missing'
-            WHERE id = %s
+            WHERE id = ANY(%s)
             """,
-            ("MISSING_OR_DELETED", row_id)
+            ("MISSING_OR_DELETED", missing_ids)
         )
-    else:
-        cursor.execute(
+    if found:
+        execute_values(
+            cursor,
             """
             UPDATE fact_checks
-            SET tweet_text = %s, 
-                tweet_vector = %s::vector,
-                tweet_format = %s
-            WHERE id = %s
+            SET tweet_text = v.tweet_text,
+                tweet_vector = v.tweet_vector,
+                tweet_format = v.tweet_format
+            FROM (VALUES %s) AS v(id, tweet_text, tweet_vector, tweet_format)
+            WHERE fact_checks.id = v.id
             """,
-            (tweet_text, tweet_vector, tweet_format, row_id)
+            found,
+            template="(%s, %s, %s::halfvec, %s)",
+            page_size=UPDATE_PAGE_SIZE,
         )
 
-def main():
+async def enrich():
     print(f"Loading embedding model: {EMBEDDING_MODEL}")
     model = SentenceTransformer(EMBEDDING_MODEL)
+    model.max_seq_length = MAX_SEQ_LENGTH
+    if torch.cuda.is_available():
+        model.half()
 
     print("Connecting to database...")
     conn = psycopg2.connect(**DB_CONFIG)
+    register_vector(conn)
     cursor = conn.cursor()
 
     total_processed = 0
     total_success = 0
     total_missing = 0
+    total_errors = 0
+    failed_ids = []
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    throttler = Throttler(rate_limit=REQUESTS_PER_SECOND, period=1.0)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
 
-    print("Starting enrichment loop (Syndication API)...")
+    expected_total = count_null_rows(cursor)
+    print(f"Starting enrichment loop (Syndication API) for {expected_total} rows...")
     print("=" * 50)
 
-    while True:
-        rows = get_null_rows(cursor)
-        if not rows:
-            print("\nNo more rows to process. Done!")
-            break
+    pbar = tqdm(total=expected_total, unit="tweet")
 
-        print(f"\nProcessing batch of {len(rows)} rows...")
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        while True:
+            rows = get_null_rows(cursor, failed_ids)
+            if not rows:
+                break
 
-        for row_id, tweet_url in rows:
-            total_processed += 1
-            print(f"[{total_processed}] Checking: {tweet_url}")
+            results = await asyncio.gather(
+                *[fetch_tweet_details(session, semaphore, throttler, tweet_id) for _, tweet_id in rows]
+            )
 
-            result = fetch_tweet_details(tweet_url)
+            fetched = []
+            missing_ids = []
+            for (row_id, tweet_id), result in zip(rows, results):
+                total_processed += 1
 
-            if result:
-                tweet_text, tweet_format = result
-                
-                if tweet_text == "MISSING":
-                    update_row(cursor, row_id, "MISSING", None, "Missing")
-                    conn.commit()
-                    total_missing += 1
-                    print(f"  -> Tweet deleted/suspended (marked as missing)")
-                else:
-                    # Generate embedding
-                    tweet_vector = model.encode(tweet_text).tolist()
-                    update_row(cursor, row_id, tweet_text, tweet_vector, tweet_format)
-                    conn.commit()
-                    total_success += 1
-                    preview = tweet_text[:50].replace('\n', ' ')
-                    print(f"  -> Success [{tweet_format}]: {preview}...")
-            else:
-                print(f"  -> API Error (Skipping)")
-
-            time.sleep(REQUEST_DELAY)
+                if result:
+                    tweet_text, tweet_format = result
 
+                    if tweet_text == "MISSING":
+                        missing_ids.append(row_id)
+                        total_missing += 1
+                    else:
+                        fetched.append((row_id, tweet_text, tweet_format))
+                        total_success += 1
+                else:
+                    # Left NULL for the next run; don't re-request it in this one
+                    failed_ids.append(row_id)
+                    total_errors += 1
+
+                if total_processed % LOG_EVERY == 0:
+                    logger.info(
+                        "Processed %d rows: %d found, %d missing, %d errors",
+                        total_processed, total_success, total_missing, total_errors,
+                    )
+
+            pbar.update(len(rows))
+            pbar.set_postfix(success=total_success, missing=total_missing, errors=total_errors)
+
+            # Generate all embeddings for the batch in one call
+            found = []
+            if fetched:
+                tweet_vectors = model.encode(
+                    [tweet_text for _, tweet_text, _ in fetched],
+                    batch_size=ENCODE_BATCH_SIZE,
+                    normalize_embeddings=True,
+                    show_progress_bar=False,
+                )
+                found = [
+                    (row_id, tweet_text, HalfVector(tweet_vector), tweet_format)
+                    for (row_id, tweet_text, tweet_format), tweet_vector
+                    in zip(fetched, tweet_vectors)
+                ]
+
+            update_rows(cursor, found, missing_ids)
+            conn.commit()
+
+    pbar.close()
     cursor.close()
     conn.close()
     print("\n" + "=" * 50)
     print(f"Enrichment complete.")
     print(f"Found: {total_success}")
     print(f"Missing/Deleted: {total_missing}")
+    print(f"API errors: {total_errors}")
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    with logging_redirect_tqdm():
+        asyncio.run(enrich())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
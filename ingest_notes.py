@@ -6,29 +6,34 @@ filters for CURRENTLY_RATED_HELPFUL notes, deduplicates by tweet,
 generates embeddings, and batch inserts into the fact_checks table.
 """
 
+import io
 import os
+import shutil
+import struct
 import zipfile
 from datetime import datetime, timedelta
 
-import pandas as pd
+import numpy as np
 import psycopg2
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
 import requests
-from psycopg2.extras import execute_values
+import torch
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 
-DB_CONFIG = {
-    "host": "localhost",
-    "port": 5432,
-    "dbname": "truth_db",
-    "user": "truth_user",
-    "password": "truth_password",
-}
+from config import DB_CONFIG
 
 BATCH_SIZE = 1000
+ENCODE_BATCH_SIZE = 64
+MAX_SEQ_LENGTH_CAP = 128
+SEQ_LENGTH_SAMPLE_SIZE = 10_000
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 DATA_DIR = "data"
 
+COPY_CHUNK_SIZE = 1 << 20  # 1 MiB
+
 BASE_URL = "https://ton.twimg.com/birdwatch-public-data"
 
 # Maps base filename to its subdirectory
@@ -107,24 +112,20 @@ def download_latest_data() -> tuple[str, str] | None:
                         
                         if internal_files:
                             internal_name = internal_files[0]
-                            # Extract to temp location
-                            zf.extract(internal_name, DATA_DIR)
-                            
-                            # CRITICAL FIX: Rename the extracted file to our date-stamped name
-                            extracted_raw_path = os.path.join(DATA_DIR, internal_name)
-                            
-                            # Remove existing file if present to avoid errors
-                            if os.path.exists(local_tsv_path):
-                                os.remove(local_tsv_path)
-                                
-                            os.rename(extracted_raw_path, local_tsv_path)
-                            print(f"  Extracted & Renamed to: {local_tsv_path}")
+                            # Stream-decompress straight into our date-stamped name,
+                            # one linear pass with no intermediate extracted file
+                            with zf.open(internal_name) as src, open(local_tsv_path, "wb") as dst:
+                                shutil.copyfileobj(src, dst, length=COPY_CHUNK_SIZE)
+                            print(f"  Extracted to: {local_tsv_path}")
                         else:
                             print(f"  No TSV found in ZIP")
                             success = False
                             break
                 except Exception as e:
                     print(f"  Extraction failed: {e}")
+                    # Don't leave a partial TSV that the next run would treat as complete
+                    if os.path.exists(local_tsv_path):
+                        os.remove(local_tsv_path)
                     success = False
                     break
                 finally:
@@ -162,50 +163,143 @@ def download_latest_data() -> tuple[str, str] | None:
     return None
 
 
-def load_and_filter_notes(notes_path: str, status_path: str) -> pd.DataFrame:
+def read_tsv(path: str, columns: list[str], column_types: dict | None = None) -> pa.Table:
+    """Read only the needed columns of a TSV with PyArrow's multithreaded parser."""
+    return pv.read_csv(
+        path,
+        parse_options=pv.ParseOptions(delimiter="\t", newlines_in_values=True),
+        convert_options=pv.ConvertOptions(
+            include_columns=columns,
+            column_types=column_types or {},
+        ),
+    )
+
+
+def load_and_filter_notes(notes_path: str, status_path: str) -> pa.Table:
     """Load TSV files and filter for currently helpful notes."""
     print("Loading notes TSV...")
-    # Using low_memory=False to suppress mixed type warnings
-    notes_df = pd.read_csv(notes_path, sep="\t", low_memory=False)
+    notes = read_tsv(
+        notes_path,
+        ["noteId", "tweetId", "summary"],
+        {"noteId": pa.int64(), "tweetId": pa.int64(), "summary": pa.string()},
+    )
 
     print("Loading status history TSV...")
-    status_df = pd.read_csv(status_path, sep="\t", low_memory=False)
+    status = read_tsv(
+        status_path,
+        ["noteId", "currentStatus"],
+        {"noteId": pa.int64(), "currentStatus": pa.string()},
+    )
 
     # Filter for CURRENTLY_RATED_HELPFUL status
-    helpful_status = status_df[status_df["currentStatus"] == "CURRENTLY_RATED_HELPFUL"]
-
-    # Join on noteId to get only helpful notes
-    helpful_notes = notes_df.merge(
-        helpful_status[["noteId"]],
-        on="noteId",
-        how="inner"
+    helpful_status = status.filter(pc.equal(status["currentStatus"], "CURRENTLY_RATED_HELPFUL"))
+
+    # Join on noteId to get only helpful notes. The hash join doesn't keep
+    # row order, so restore notes-file order for a deterministic dedupe.
+    notes = notes.append_column("_row", pa.array(np.arange(notes.num_rows)))
+    helpful_notes = notes.join(
+        helpful_status.select(["noteId"]),
+        keys="noteId",
+        join_type="inner"
     )
+    helpful_notes = helpful_notes.sort_by("_row").drop_columns(["_row"])
 
-    print(f"Found {len(helpful_notes)} helpful notes out of {len(notes_df)} total")
+    print(f"Found {helpful_notes.num_rows} helpful notes out of {notes.num_rows} total")
     return helpful_notes
 
 
-def generate_embeddings_batch(model: SentenceTransformer, texts: list[str]) -> list[list[float]]:
-    """Generate embeddings for a batch of texts."""
-    embeddings = model.encode(texts, show_progress_bar=False)
-    return embeddings.tolist()
+def dedupe_by_tweet(notes: pa.Table) -> pa.Table:
+    """Keep the first note (in notes-file order) for each tweetId."""
+    tweet_ids = notes["tweetId"]
+    first_rows = pc.index_in(pc.unique(tweet_ids), value_set=tweet_ids)
+    return notes.take(first_rows)
+
+
+def generate_embeddings_batch(model: SentenceTransformer, texts: list[str]) -> np.ndarray:
+    """
+    Generate normalized embeddings for a batch of texts.
+    Texts are encoded shortest-first so each sub-batch pads to a similar
+    length, then scattered back to their original positions.
+    """
+    order = np.argsort([len(t) for t in texts], kind="stable")
+    embeddings = model.encode(
+        [texts[i] for i in order],
+        batch_size=ENCODE_BATCH_SIZE,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
+    out = np.empty_like(embeddings)
+    out[order] = embeddings
+    return out
+
+
+def tune_max_seq_length(model: SentenceTransformer, texts: list[str]):
+    """
+    Set the model's max_seq_length to the 99th-percentile token length
+    of the texts (sampled), capped at MAX_SEQ_LENGTH_CAP.
+    """
+    step = max(1, len(texts) // SEQ_LENGTH_SAMPLE_SIZE)
+    sample = texts[::step]
+    lengths = [len(ids) for ids in model.tokenizer(sample)["input_ids"]]
+    p99 = int(np.percentile(lengths, 99))
+    model.max_seq_length = min(MAX_SEQ_LENGTH_CAP, p99)
+    print(f"Set max_seq_length to {model.max_seq_length} (p99 summary length: {p99} tokens)")
+
+
+# Binary COPY framing: header, per-tuple field count, per-field length
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+PGCOPY_TRAILER = struct.pack("!h", -1)
+
+
+def copy_field(data: bytes) -> bytes:
+    return struct.pack("!i", len(data)) + data
+
+
+def halfvec_binary(vector: np.ndarray) -> bytes:
+    """pgvector halfvec wire format: int16 dim, int16 unused, big-endian float16 values."""
+    return struct.pack("!hh", len(vector), 0) + vector.astype(">f2").tobytes()
+
+
+def build_copy_payload(batch_data: list[tuple]) -> io.BytesIO:
+    """Encode (tweet_id, note_text, note_vector) rows as a binary COPY stream."""
+    buf = io.BytesIO()
+    buf.write(PGCOPY_HEADER)
+    for tweet_id, note_text, note_vector in batch_data:
+        buf.write(struct.pack("!h", 3))
+        buf.write(copy_field(struct.pack("!q", tweet_id)))
+        buf.write(copy_field(note_text.encode("utf-8")))
+        buf.write(copy_field(halfvec_binary(note_vector)))
+    buf.write(PGCOPY_TRAILER)
+    buf.seek(0)
+    return buf
 
 
 def insert_batch(cursor, batch_data: list[tuple]):
-    """Insert a batch of records into fact_checks."""
-    execute_values(
-        cursor,
-        """
-        INSERT INTO fact_checks (tweet_id, tweet_url, note_text, note_vector)
-        VALUES %s
+    """
+    Insert a batch of records into fact_checks.
+    Rows are streamed into a temp staging table with binary COPY (no
+    text float parsing), then upserted in one INSERT ... SELECT.
+    """
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS fact_checks_staging (
+            tweet_id BIGINT,
+            note_text TEXT,
+            note_vector halfvec(384)
+        ) ON COMMIT DELETE ROWS
+    """)
+    cursor.copy_expert(
+        "COPY fact_checks_staging (tweet_id, note_text, note_vector) FROM STDIN WITH (FORMAT BINARY)",
+        build_copy_payload(batch_data),
+    )
+    cursor.execute("""
+        INSERT INTO fact_checks (tweet_id, note_text, note_vector)
+        SELECT tweet_id, note_text, note_vector
+        FROM fact_checks_staging
         ON CONFLICT (tweet_id) DO UPDATE SET
-            tweet_url = EXCLUDED.tweet_url,
             note_text = EXCLUDED.note_text,
             note_vector = EXCLUDED.note_vector
-        """,
-        batch_data,
-        template="(%s, %s, %s, %s::vector)"
-    )
+    """)
 
 
 def main():
@@ -220,20 +314,27 @@ def main():
     # Load and filter data
     helpful_notes = load_and_filter_notes(notes_path, status_path)
 
-    if helpful_notes.empty:
+    if helpful_notes.num_rows == 0:
         print("No helpful notes found. Exiting.")
         return
 
     # --- CRITICAL FIX: Deduplicate by tweetId ---
     # We only need one note per tweet. This prevents batch collisions.
-    print(f"Deduplicating notes... (Initial count: {len(helpful_notes)})")
-    helpful_notes = helpful_notes.drop_duplicates(subset=['tweetId'], keep='first')
-    print(f"Unique tweets to process: {len(helpful_notes)}")
+    print(f"Deduplicating notes... (Initial count: {helpful_notes.num_rows})")
+    helpful_notes = dedupe_by_tweet(helpful_notes)
+    print(f"Unique tweets to process: {helpful_notes.num_rows}")
     # --------------------------------------------
 
+    # Convert to Python lists once, after filtering and dedup
+    all_tweet_ids = helpful_notes["tweetId"].to_pylist()
+    all_summaries = pc.fill_null(helpful_notes["summary"], "").to_pylist()
+
     # Load embedding model
     print(f"Loading embedding model: {EMBEDDING_MODEL}")
     model = SentenceTransformer(EMBEDDING_MODEL)
+    if torch.cuda.is_available():
+        model.half()
+    tune_max_seq_length(model, all_summaries)
 
     # Connect to database
     print("Connecting to database...")
@@ -241,7 +342,7 @@ def main():
     cursor = conn.cursor()
 
     # Process in batches
-    total_notes = len(helpful_notes)
+    total_notes = len(all_tweet_ids)
     total_batches = (total_notes + BATCH_SIZE - 1) // BATCH_SIZE
 
     print(f"Processing {total_notes} notes in {total_batches} batches of {BATCH_SIZE}...")
@@ -250,23 +351,19 @@ def main():
 
     for batch_start in tqdm(range(0, total_notes, BATCH_SIZE), desc="Inserting batches"):
         batch_end = min(batch_start + BATCH_SIZE, total_notes)
-        batch_df = helpful_notes.iloc[batch_start:batch_end]
 
         # Extract tweet IDs and summaries
-        tweet_ids = batch_df["tweetId"].tolist()
-        summaries = batch_df["summary"].fillna("").tolist()
-
-        # Build tweet URLs
-        tweet_urls = [f"https://twitter.com/i/web/status/{tid}" for tid in tweet_ids]
+        tweet_ids = all_tweet_ids[batch_start:batch_end]
+        summaries = all_summaries[batch_start:batch_end]
 
         # Generate embeddings for note text (The Truth)
         note_vectors = generate_embeddings_batch(model, summaries)
 
         # Prepare batch data for insertion
         batch_data = [
-            (tweet_id, tweet_url, note_text, note_vector)
-            for tweet_id, tweet_url, note_text, note_vector
-            in zip(tweet_ids, tweet_urls, summaries, note_vectors)
+            (tweet_id, note_text, note_vector)
+            for tweet_id, note_text, note_vector
+            in zip(tweet_ids, summaries, note_vectors)
         ]
 
         # Insert batch
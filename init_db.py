@@ -1,58 +1,219 @@
+"""
+HNSW index builds for the Truth Engine database.
+
+Tables are created by the versioned migrations in migrations/ (see
+migrate.py). Indexes are built separately so the HNSW graphs are built
+once over loaded data instead of being updated on every insert:
+
+    python migrate.py                  # extension + tables
+    python ingest_notes.py             # bulk load fact_checks
+    python migrate.py --with-indexes   # build HNSW indexes
+
+Indexes are built CONCURRENTLY, so --with-indexes can also be run
+against a live table without blocking writes. Rerunning it only rebuilds
+indexes whose definition has changed.
+"""
+
+import time
+
 import psycopg2
+from psycopg2 import sql
+
+from config import DB_CONFIG, HNSW_EF_SEARCH
+
 
-DB_CONFIG = {
-    "host": "localhost",
-    "port": 5432,
-    "dbname": "truth_db",
-    "user": "truth_user",
-    "password": "truth_password",
+def configure_hnsw_params(vector_count: int) -> dict:
+    """
+    Pick HNSW build/search parameters for the corpus size. Larger graphs
+    need more connectivity (m) and a better build (ef_construction) to
+    keep recall up.
+    """
+    if vector_count < 100_000:
+        return {"m": 16, "ef_construction": 64, "ef_search": 40}
+    if vector_count < 1_000_000:
+        return {"m": 24, "ef_construction": 128, "ef_search": 100}
+    return {"m": 32, "ef_construction": 128, "ef_search": 200}
+
+
+def estimate_row_count(cur, table: str) -> int:
+    """
+    Planner row estimate; avoids a full COUNT(*) scan. ANALYZE first so a
+    freshly bulk-loaded table (reltuples -1 or stale) isn't sized as empty.
+    """
+    cur.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(table)))
+    cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", (table,))
+    return max(0, cur.fetchone()[0])
+
+
+# Session settings for index builds: keep the HNSW graph in memory and
+# use parallel workers (pgvector 0.6+)
+INDEX_BUILD_SETTINGS = {
+    "maintenance_work_mem": "2GB",
+    "max_parallel_maintenance_workers": "7",
+    "max_parallel_workers": "8",
 }
 
 
-def init_database():
-    conn = psycopg2.connect(**DB_CONFIG)
-    conn.autocommit = True
-    cur = conn.cursor()
-
-    # Enable pgvector extension
-    cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-    print("pgvector extension enabled")
-
-    # Create fact_checks table (Lie vs Truth pairs)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS fact_checks (
-            id SERIAL PRIMARY KEY,
-            tweet_id BIGINT UNIQUE NOT NULL,
-            tweet_url TEXT,
-            tweet_text TEXT,
-            tweet_vector vector(384),
-            note_text TEXT NOT NULL,
-            note_vector vector(384),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
-    print("fact_checks table created")
-
-    # Create HNSW index on tweet_vector (The Lie)
-    cur.execute("""
-        CREATE INDEX IF NOT EXISTS fact_checks_tweet_vector_idx
+def tune_index_build(cur):
+    """Raise build-time GUCs for this session. Skips any the server won't let us set."""
+    for name, value in INDEX_BUILD_SETTINGS.items():
+        try:
+            cur.execute(f"SET {name} = %s", (value,))
+        except psycopg2.Error as e:
+            print(f"Could not set {name} (using server default): {e}")
+
+
+def get_index(cur, name: str) -> tuple[str, bool] | None:
+    """(pg_indexes.indexdef, indisvalid) for index `name`, or None if it doesn't exist."""
+    cur.execute(
+        """
+        SELECT i.indexdef, x.indisvalid
+        FROM pg_indexes i
+        JOIN pg_class c ON c.relname = i.indexname
+            AND c.relnamespace = i.schemaname::regnamespace
+        JOIN pg_index x ON x.indexrelid = c.oid
+        WHERE i.indexname = %s
+        """,
+        (name,),
+    )
+    return cur.fetchone()
+
+
+def index_matches(cur, name: str, expected: list[str]) -> bool:
+    """
+    True if a valid index `name` exists and its pg_indexes.indexdef contains
+    every expected fragment (access method, opclass, options, predicate).
+    IF NOT EXISTS only checks the name, so this catches parameter drift and
+    INVALID leftovers from a failed CONCURRENTLY build.
+    """
+    row = get_index(cur, name)
+    if row is None:
+        return False
+    indexdef, valid = row
+    return valid and all(fragment in indexdef for fragment in expected)
+
+
+def ensure_index(cur, name: str, definition: str, expected: list[str]):
+    """
+    Build `CREATE INDEX CONCURRENTLY name <definition>` unless a matching index
+    already exists. A valid but outdated index keeps serving queries while its
+    replacement is built under a temporary name, then the two are swapped.
+    """
+    if index_matches(cur, name, expected):
+        print(f"{name} is up to date, skipping")
+        return
+
+    start = time.perf_counter()
+    index = sql.Identifier(name)
+    row = get_index(cur, name)
+    if row is None or not row[1]:
+        # Missing, or an INVALID leftover that no query can use: build in place
+        cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(index))
+        cur.execute(sql.SQL("CREATE INDEX CONCURRENTLY {} ").format(index) + sql.SQL(definition))
+    else:
+        new_index = sql.Identifier(f"{name}_new")
+        # Clear out a replacement left behind by an interrupted rebuild
+        cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(new_index))
+        cur.execute(sql.SQL("CREATE INDEX CONCURRENTLY {} ").format(new_index) + sql.SQL(definition))
+        cur.execute(sql.SQL("DROP INDEX CONCURRENTLY {}").format(index))
+        cur.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(new_index, index))
+    print(f"{name} built in {time.perf_counter() - start:.1f}s")
+
+
+def create_indexes(cur):
+    """
+    Create partial HNSW indexes so searches skip the exact O(N) scan.
+    Embeddings are stored unit-norm, so inner product ranks the same as
+    cosine and skips the per-comparison norm computation.
+    Indexes whose definition already matches are left alone; changed ones
+    (e.g. new HNSW params after the table grew) are rebuilt alongside the
+    old index and swapped in, so searches never lose their index.
+    Built CONCURRENTLY, so the connection must be in autocommit mode and
+    each statement is sent on its own (CONCURRENTLY can't run inside the
+    implicit transaction of a multi-statement query).
+    """
+    tune_index_build(cur)
+    params = configure_hnsw_params(estimate_row_count(cur, "fact_checks"))
+    print(f"Using HNSW m={params['m']}, ef_construction={params['ef_construction']}")
+    hnsw_options = [f"m='{params['m']}'", f"ef_construction='{params['ef_construction']}'"]
+    hnsw_with = f"WITH (m = {params['m']}, ef_construction = {params['ef_construction']})"
+
+    # HNSW index on tweet_vector (The Lie)
+    # Partial: most rows have no tweet text yet, so don't index NULLs
+    ensure_index(
+        cur,
+        "fact_checks_tweet_vector_idx",
+        f"""
+        ON fact_checks
+        USING hnsw (tweet_vector halfvec_ip_ops)
+        {hnsw_with}
+        WHERE tweet_vector IS NOT NULL;
+        """,
+        ["USING hnsw (tweet_vector halfvec_ip_ops)", *hnsw_options, "WHERE (tweet_vector IS NOT NULL)"],
+    )
+
+    # HNSW index on note_vector (The Truth)
+    ensure_index(
+        cur,
+        "fact_checks_note_vector_idx",
+        f"""
         ON fact_checks
-        USING hnsw (tweet_vector vector_cosine_ops);
-    """)
-    print("HNSW index created on tweet_vector (The Lie)")
+        USING hnsw (note_vector halfvec_ip_ops)
+        {hnsw_with}
+        WHERE note_vector IS NOT NULL;
+        """,
+        ["USING hnsw (note_vector halfvec_ip_ops)", *hnsw_options, "WHERE (note_vector IS NOT NULL)"],
+    )
+
+    # Partial HNSW index for searches restricted to classified tweets, so
+    # the filter is applied by the index instead of post-filtering results
+    ensure_index(
+        cur,
+        "fact_checks_note_vector_ai_idx",
+        f"""
+        ON fact_checks
+        USING hnsw (note_vector halfvec_ip_ops)
+        {hnsw_with}
+        WHERE tweet_format IS NOT NULL;
+        """,
+        ["USING hnsw (note_vector halfvec_ip_ops)", *hnsw_options, "WHERE (tweet_format IS NOT NULL)"],
+    )
+
+    # Covering btree for recent-notes listings: index-only scan, no heap fetches
+    ensure_index(
+        cur,
+        "fact_checks_tweet_id_created_idx",
+        """
+        ON fact_checks (created_at DESC)
+        INCLUDE (tweet_id, note_text);
+        """,
+        ["USING btree (created_at DESC) INCLUDE (tweet_id, note_text)"],
+    )
 
-    # Create HNSW index on note_vector (The Truth)
-    cur.execute("""
-        CREATE INDEX IF NOT EXISTS fact_checks_note_vector_idx
+    # BRIN for date-range scans over append-mostly data: a few pages of
+    # summaries instead of a full btree
+    ensure_index(
+        cur,
+        "fact_checks_created_at_brin",
+        """
         ON fact_checks
-        USING hnsw (note_vector vector_cosine_ops);
-    """)
-    print("HNSW index created on note_vector (The Truth)")
+        USING brin (created_at)
+        WITH (pages_per_range = 32);
+        """,
+        ["USING brin (created_at)", "pages_per_range='32'"],
+    )
 
-    cur.close()
-    conn.close()
-    print("Database initialization complete")
+    set_default_ef_search(cur, HNSW_EF_SEARCH or params["ef_search"])
 
 
-if __name__ == "__main__":
-    init_database()
+def set_default_ef_search(cur, ef_search: int):
+    """Persist hnsw.ef_search as the database default so every search session gets it."""
+    try:
+        cur.execute(
+            sql.SQL("ALTER DATABASE {} SET hnsw.ef_search = {}").format(
+                sql.Identifier(DB_CONFIG["dbname"]), sql.Literal(ef_search)
+            )
+        )
+        print(f"Default hnsw.ef_search set to {ef_search}")
+    except psycopg2.Error as e:
+        print(f"Could not set database default hnsw.ef_search: {e}")
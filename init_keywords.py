@@ -1,20 +1,18 @@
 """
-Initialize keyword filters table and populate with AI-related keywords.
+Populate the keyword_filters table with AI-related keywords.
 
-This creates semantic filters that can be joined with fact_checks
-to find notes about specific topics (e.g., AI generated content).
+These are semantic filters that can be joined with fact_checks to find
+notes about specific topics (e.g., AI generated content). The table is
+created by migrations/0002_keywords.sql; load the rows with
+`python migrate.py --seed-keywords`.
 """
 
-import psycopg2
-from sentence_transformers import SentenceTransformer
+from pgvector import HalfVector
+from pgvector.psycopg2 import register_vector
+from psycopg2.extras import execute_batch
 
-DB_CONFIG = {
-    "host": "localhost",
-    "port": 5432,
-    "dbname": "truth_db",
-    "user": "truth_user",
-    "password": "truth_password",
-}
+from db import conn
+from encoder import OnnxEncoder
 
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
@@ -25,56 +23,59 @@ KEYWORDS = [
 ]
 
 
-def main():
+def prepare_upsert(cursor):
+    """
+    Prepare the keyword upsert once per connection so each row skips
+    parsing and planning. Pooled connections keep it, so skip if present.
+    """
+    cursor.execute("SELECT 1 FROM pg_prepared_statements WHERE name = 'kw_upsert'")
+    if cursor.fetchone():
+        return
+    cursor.execute(
+        """
+        PREPARE kw_upsert (text, halfvec) AS
+        INSERT INTO keyword_filters (keyword, keyword_vector)
+        VALUES ($1, $2)
+        ON CONFLICT (keyword) DO UPDATE SET
+            keyword_vector = EXCLUDED.keyword_vector
+        """
+    )
+
+
+def refresh_ai_related_notes(cursor):
+    """Recompute the ai_related_notes materialized view without blocking readers."""
+    print("Refreshing ai_related_notes...")
+    cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY ai_related_notes;")
+
+
+def seed_keywords():
+    """Encode KEYWORDS and upsert them into keyword_filters."""
     # Load embedding model
-    print(f"Loading embedding model: {EMBEDDING_MODEL}")
-    model = SentenceTransformer(EMBEDDING_MODEL)
+    print(f"Loading embedding model: {EMBEDDING_MODEL} (ONNX INT8)")
+    model = OnnxEncoder()
 
-    # Connect to database
+    # Borrow a pooled connection
     print("Connecting to database...")
-    conn = psycopg2.connect(**DB_CONFIG)
-    conn.autocommit = True
-    cursor = conn.cursor()
-
-    # Create keyword_filters table
-    print("Creating keyword_filters table...")
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS keyword_filters (
-            id SERIAL PRIMARY KEY,
-            keyword TEXT UNIQUE NOT NULL,
-            keyword_vector vector(384),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
-
-    # Create HNSW index for fast similarity search
-    cursor.execute("""
-        CREATE INDEX IF NOT EXISTS keyword_filters_vector_idx
-        ON keyword_filters
-        USING hnsw (keyword_vector vector_cosine_ops);
-    """)
-    print("Table and index created.")
-
-    # Insert keywords with embeddings
-    print(f"\nInserting {len(KEYWORDS)} keywords...")
-    for keyword in KEYWORDS:
-        # Generate embedding
-        embedding = model.encode(keyword).tolist()
-
-        # Upsert
-        cursor.execute(
-            """
-            INSERT INTO keyword_filters (keyword, keyword_vector)
-            VALUES (%s, %s::vector)
-            ON CONFLICT (keyword) DO UPDATE SET
-                keyword_vector = EXCLUDED.keyword_vector
-            """,
-            (keyword, embedding)
-        )
-        print(f"  Inserted: '{keyword}'")
-
-    cursor.close()
-    conn.close()
+    with conn() as c, c.cursor() as cursor:
+        # Adapt HalfVector params directly instead of casting list strings
+        register_vector(c)
+        prepare_upsert(cursor)
+
+        # Insert keywords with embeddings
+        print(f"\nInserting {len(KEYWORDS)} keywords...")
+        # Generate all embeddings in one batched forward pass
+        # (OnnxEncoder output is already L2-normalized)
+        embeddings = model.encode(KEYWORDS)
+
+        # Upsert through the prepared statement; execute_batch sends
+        # page_size EXECUTEs per round-trip
+        rows = [(keyword, HalfVector(embedding)) for keyword, embedding in zip(KEYWORDS, embeddings)]
+        execute_batch(cursor, "EXECUTE kw_upsert (%s, %s)", rows, page_size=500)
+        for keyword in KEYWORDS:
+            print(f"  Inserted: '{keyword}'")
+
+        # Matches depend on the keyword vectors, so recompute them
+        refresh_ai_related_notes(cursor)
 
     print("\n" + "=" * 60)
     print("Done! Keyword filters created.")
@@ -84,50 +85,51 @@ def main():
     print("""
 USAGE: Find fact_checks that semantically match your keywords
 
+-- hnsw.ef_search caps how many candidates an HNSW scan returns; raise it
+-- per query with SET LOCAL inside a transaction for deeper result sets.
+-- Adding "AND fc.tweet_format IS NOT NULL" lets the planner use the
+-- smaller partial index fact_checks_note_vector_ai_idx.
+--
+-- All vectors are stored unit-norm, so the indexes use inner-product ops:
+-- <#> is the negative inner product, 1 + (a <#> b) equals cosine distance,
+-- and "a <#> b < -0.5" is the same filter as cosine distance < 0.5.
+
 -- Option 1: Find notes similar to ANY keyword (threshold: 0.5)
+BEGIN;
+SET LOCAL hnsw.ef_search = 200;
 SELECT
     fc.id,
-    fc.tweet_url,
+    fc.tweet_id,
     fc.note_text,
     kf.keyword,
-    fc.note_vector <=> kf.keyword_vector AS distance
+    1 + (fc.note_vector <#> kf.keyword_vector) AS distance
 FROM fact_checks fc
 CROSS JOIN keyword_filters kf
-WHERE fc.note_vector <=> kf.keyword_vector < 0.5
+WHERE fc.note_vector <#> kf.keyword_vector < -0.5
 ORDER BY distance ASC
 LIMIT 100;
+COMMIT;
 
 -- Option 2: Find notes matching a SPECIFIC keyword
+BEGIN;
+SET LOCAL hnsw.ef_search = 200;
 SELECT
     fc.id,
-    fc.tweet_url,
+    fc.tweet_id,
     fc.note_text,
-    fc.note_vector <=> kf.keyword_vector AS distance
+    1 + (fc.note_vector <#> kf.keyword_vector) AS distance
 FROM fact_checks fc
 JOIN keyword_filters kf ON kf.keyword = 'AI generated'
-WHERE fc.note_vector <=> kf.keyword_vector < 0.5
+WHERE fc.note_vector <#> kf.keyword_vector < -0.5
 ORDER BY distance ASC
 LIMIT 50;
-
--- Option 3: Create a VIEW for easy access
-CREATE VIEW ai_related_notes AS
-SELECT DISTINCT ON (fc.id)
-    fc.id,
-    fc.tweet_id,
-    fc.tweet_url,
-    fc.tweet_text,
-    fc.note_text,
-    kf.keyword AS matched_keyword,
-    fc.note_vector <=> kf.keyword_vector AS similarity_distance
-FROM fact_checks fc
-CROSS JOIN keyword_filters kf
-WHERE fc.note_vector <=> kf.keyword_vector < 0.5
-ORDER BY fc.id, similarity_distance ASC;
-
--- Then just query the view:
-SELECT * FROM ai_related_notes LIMIT 100;
+COMMIT;
+
+-- Option 3: Read the precomputed matches (materialized view ai_related_notes,
+-- refreshed with: python migrate.py --refresh-views)
+SELECT id, tweet_id, note_text, d
+FROM ai_related_notes
+WHERE matched_keyword = 'AI generated'
+ORDER BY d
+LIMIT 100;
 """)
-
-
-if __name__ == "__main__":
-    main()
@@ -0,0 +1,94 @@
+"""
+Apply pending schema migrations from migrations/, in order.
+
+Each migrations/NNNN_name.sql file runs in its own transaction together
+with its schema_migrations record, so a failed migration leaves nothing
+half-applied and reruns skip what is already done.
+
+    python migrate.py                   # apply pending migrations
+    python migrate.py --seed-keywords   # also (re)load keyword filters
+    python migrate.py --with-indexes    # also build HNSW indexes (after bulk load)
+    python migrate.py --refresh-views   # recompute materialized views (after ingest)
+"""
+
+import argparse
+import os
+
+from db import conn
+from init_db import create_indexes
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+
+def pending_migrations(cur) -> list[str]:
+    """Migration versions (file names without .sql) not yet recorded, in order."""
+    cur.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in cur.fetchall()}
+    versions = sorted(f[:-4] for f in os.listdir(MIGRATIONS_DIR) if f.endswith(".sql"))
+    return [v for v in versions if v not in applied]
+
+
+def migrate():
+    with conn() as c, c.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version TEXT PRIMARY KEY,
+                applied_at TIMESTAMP DEFAULT NOW()
+            );
+        """)
+        pending = pending_migrations(cur)
+
+    if not pending:
+        print("Schema is up to date")
+        return
+
+    for version in pending:
+        with open(os.path.join(MIGRATIONS_DIR, f"{version}.sql")) as f:
+            ddl = f.read()
+
+        print(f"Applying {version}...")
+        # One transaction per migration: the DDL and its record commit together
+        with conn() as c, c.cursor() as cur:
+            cur.execute(ddl)
+            cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+
+    print(f"Applied {len(pending)} migration(s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate the Truth Engine database.")
+    parser.add_argument(
+        "--seed-keywords",
+        action="store_true",
+        help="Encode and upsert the keyword filters after migrating",
+    )
+    parser.add_argument(
+        "--refresh-views",
+        action="store_true",
+        help="Refresh the ai_related_notes materialized view (run after ingesting)",
+    )
+    parser.add_argument(
+        "--with-indexes",
+        action="store_true",
+        help="Also build missing or changed indexes (run after bulk loading data)",
+    )
+    args = parser.parse_args()
+
+    migrate()
+
+    if args.seed_keywords:
+        # Loads the ONNX encoder, so only import it when needed
+        from init_keywords import seed_keywords
+
+        seed_keywords()
+    elif args.refresh_views:
+        from init_keywords import refresh_ai_related_notes
+
+        with conn() as c, c.cursor() as cur:
+            refresh_ai_related_notes(cur)
+
+    if args.with_indexes:
+        with conn(autocommit=True) as c, c.cursor() as cur:
+            create_indexes(cur)
+    else:
+        print("Skipping indexes; run with --with-indexes after loading data")
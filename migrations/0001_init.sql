@@ -0,0 +1,14 @@
+-- pgvector and the fact_checks table (Lie vs Truth pairs).
+-- Vectors are stored as FP16 halfvec (pgvector 0.7+) to halve size and scan bandwidth.
+-- HNSW indexes are built separately, after bulk loading: python migrate.py --with-indexes
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE TABLE IF NOT EXISTS fact_checks (
+    id SERIAL PRIMARY KEY,
+    tweet_id BIGINT UNIQUE NOT NULL,
+    tweet_text TEXT,
+    tweet_vector halfvec(384),
+    note_text TEXT NOT NULL,
+    note_vector halfvec(384),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
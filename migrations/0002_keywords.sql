@@ -0,0 +1,14 @@
+-- Semantic keyword filters joined against fact_checks (rows are loaded by
+-- python migrate.py --seed-keywords). The table holds a handful of rows, so
+-- the smallest HNSW tier from init_db.configure_hnsw_params is used.
+CREATE TABLE IF NOT EXISTS keyword_filters (
+    id SERIAL PRIMARY KEY,
+    keyword TEXT UNIQUE NOT NULL,
+    keyword_vector halfvec(384),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS keyword_filters_vector_idx
+ON keyword_filters
+USING hnsw (keyword_vector halfvec_cosine_ops)
+WITH (m = 16, ef_construction = 64);
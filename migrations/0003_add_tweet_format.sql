@@ -0,0 +1,3 @@
+-- Media format of the tweet; the partial index fact_checks_note_vector_ai_idx
+-- covers only rows where it is set.
+ALTER TABLE fact_checks ADD COLUMN IF NOT EXISTS tweet_format TEXT;
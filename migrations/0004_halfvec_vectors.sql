@@ -0,0 +1,39 @@
+-- Databases created before the halfvec switch still hold FP32 vector(384)
+-- columns. Convert them in place; fresh databases already match and skip this.
+-- The old vector_cosine_ops indexes can't survive the type change, so they are
+-- dropped (fact_checks indexes come back with --with-indexes).
+--
+-- Older setup instructions had users create a plain ai_related_notes VIEW
+-- over note_vector and tweet_url. It would block this type change and the
+-- tweet_url drop in 0005; 0007 recreates it as a materialized view.
+DROP VIEW IF EXISTS ai_related_notes;
+
+DO $$
+BEGIN
+    IF (
+        SELECT format_type(atttypid, atttypmod)
+        FROM pg_attribute
+        WHERE attrelid = 'fact_checks'::regclass AND attname = 'note_vector'
+    ) <> 'halfvec(384)' THEN
+        DROP INDEX IF EXISTS fact_checks_tweet_vector_idx;
+        DROP INDEX IF EXISTS fact_checks_note_vector_idx;
+        ALTER TABLE fact_checks
+            ALTER COLUMN tweet_vector TYPE halfvec(384) USING tweet_vector::halfvec(384),
+            ALTER COLUMN note_vector TYPE halfvec(384) USING note_vector::halfvec(384);
+    END IF;
+
+    IF (
+        SELECT format_type(atttypid, atttypmod)
+        FROM pg_attribute
+        WHERE attrelid = 'keyword_filters'::regclass AND attname = 'keyword_vector'
+    ) <> 'halfvec(384)' THEN
+        DROP INDEX IF EXISTS keyword_filters_vector_idx;
+        ALTER TABLE keyword_filters
+            ALTER COLUMN keyword_vector TYPE halfvec(384) USING keyword_vector::halfvec(384);
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS keyword_filters_vector_idx
+ON keyword_filters
+USING hnsw (keyword_vector halfvec_cosine_ops)
+WITH (m = 16, ef_construction = 64);
@@ -0,0 +1,3 @@
+-- tweet_url is derived from tweet_id at read time; drop the stored copy
+-- from databases created before that change.
+ALTER TABLE fact_checks DROP COLUMN IF EXISTS tweet_url;
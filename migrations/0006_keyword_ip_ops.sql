@@ -0,0 +1,9 @@
+-- Keyword vectors are stored unit-norm (like fact_checks), so inner product
+-- ranks the same as cosine without the per-comparison norm computation.
+-- Switch the keyword index to inner-product ops to match the fact_checks indexes.
+DROP INDEX IF EXISTS keyword_filters_vector_idx;
+
+CREATE INDEX keyword_filters_vector_idx
+ON keyword_filters
+USING hnsw (keyword_vector halfvec_ip_ops)
+WITH (m = 16, ef_construction = 64);
@@ -0,0 +1,20 @@
+-- Notes matching any keyword filter, precomputed. The cross join costs
+-- |fact_checks| x |keywords| distance evaluations, but matches change only
+-- when notes or keywords do, so readers get a btree lookup instead.
+-- Refresh after ingesting or reseeding: python migrate.py --refresh-views
+-- Vectors are unit-norm: d = 1 + (a <#> b) is cosine distance.
+CREATE MATERIALIZED VIEW IF NOT EXISTS ai_related_notes AS
+SELECT DISTINCT ON (fc.id)
+    fc.id,
+    fc.tweet_id,
+    fc.note_text,
+    kf.keyword AS matched_keyword,
+    1 + (fc.note_vector <#> kf.keyword_vector) AS d
+FROM fact_checks fc
+CROSS JOIN keyword_filters kf
+WHERE fc.note_vector <#> kf.keyword_vector < -0.5
+ORDER BY fc.id, d;
+
+-- Unique index is required for REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS ai_related_notes_id_idx ON ai_related_notes (id);
+CREATE INDEX IF NOT EXISTS ai_related_notes_keyword_d_idx ON ai_related_notes (matched_keyword, d);
@@ -0,0 +1,74 @@
+"""
+In-process semantic cache for search results.
+
+Stores L2-normalized query embeddings in a FAISS inner-product index and
+maps each entry to the result list it produced. A new query whose cosine
+similarity to a cached query clears the threshold reuses that result,
+skipping the database round-trip. Entries expire after a TTL and the
+least recently used entry is evicted once the cache is full.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any
+
+import faiss
+import numpy as np
+
+EMBEDDING_DIM = 384
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_TTL = 300.0
+DEFAULT_MAX_ENTRIES = 10_000
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        dim: int = EMBEDDING_DIM,
+        threshold: float = DEFAULT_THRESHOLD,
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # IDMap lets us remove evicted/expired vectors without a rebuild
+        self.index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+        self.entries: OrderedDict[int, tuple[Any, float]] = OrderedDict()
+        self.next_id = 0
+
+    def _remove(self, entry_id: int):
+        self.entries.pop(entry_id, None)
+        self.index.remove_ids(np.array([entry_id], dtype=np.int64))
+
+    def get(self, embedding: np.ndarray) -> Any | None:
+        """Return the cached result for a near-duplicate query, or None."""
+        if not self.entries:
+            return None
+
+        query = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        scores, ids = self.index.search(query, 1)
+        entry_id = int(ids[0, 0])
+        if entry_id < 0 or scores[0, 0] < self.threshold:
+            return None
+
+        result, expires_at = self.entries[entry_id]
+        if expires_at < time.monotonic():
+            self._remove(entry_id)
+            return None
+
+        self.entries.move_to_end(entry_id)
+        return result
+
+    def put(self, embedding: np.ndarray, result: Any):
+        """Cache a result under its query embedding, evicting the LRU entry if full."""
+        entry_id = self.next_id
+        self.next_id += 1
+
+        vector = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        self.index.add_with_ids(vector, np.array([entry_id], dtype=np.int64))
+        self.entries[entry_id] = (result, time.monotonic() + self.ttl)
+
+        while len(self.entries) > self.max_entries:
+            oldest_id = next(iter(self.entries))
+            self._remove(oldest_id)